@@ -1,12 +1,78 @@
 """
 Test script for the PDF Generator API
 """
+import os
+import sys
+import time
 import requests
 import json
 
 # Test HTML table (your example)
 html_table = """<table><tr><td><b>Confidence Score</b></td><td>68</td></tr><tr><td><b>Confidence Level</b></td><td>Medium</td></tr><tr><td><b>Recommended Action</b></td><td>Further Investigation Required</td></tr><tr><td><b>Asset Reference</b></td><td>02iKj00001PJJicIAH</td></tr><tr><td><b>Condition Summary</b></td><td>The asset has registered multiple claim items related to regulator performance, progressing from intermittent issues and fluctuation to complete failure and wiring shorts over a period of approximately two months.</td></tr><tr><td><b>Risk Assessment</b></td><td>The evidence documents a clear progression of a fault related to a component identified as a 'regulator'. The fault escalates from intermittent behavior to degradation and culminates in a complete operational failure and a wiring short. The operational risk is tied to the loss of function of this specific component.</td></tr><tr><td><b>Supporting Evidence</b></td><td><pre>• Claim Item CI-PUNE-002-A described an 'intermittent delay' with the regulator. • Claim Item CI-PUNE-002-B described 'performance fluctuation' with the regulator. • Claim Item CI-PUNE-003-A noted 'degradation under load' of the regulator. • Claim Item CI-PUNE-004-A cited 'regulator motor response failure'. • Claim Item CI-PUNE-005-A documented a 'Complete regulator failure under operation'. • Claim Item CI-PUNE-005-B documented a 'Regulator wiring short detected'. • A Work Order (00000276) has been created with a suggested maintenance date of 2026-02-10.</pre></td></tr></table>"""
 
+def test_parser():
+    """Test the HTML table parser directly (runs locally, no server needed)"""
+    print("Testing HTML table parsing...")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+    from index import parse_html_table
+    
+    passed = True
+    for html_input in (
+        "<table><tr><td><b>Label</b></td><td>Value</td></tr></table>",
+        "<table><tr><td><b>Label</td><td>Value</td></tr></table>",
+    ):
+        table = parse_html_table(html_input)
+        bold_cells = [cmd[1] for cmd in table.cell_styles if cmd[0] == 'FONTNAME']
+        if table.pdf_rows == [['Label', 'Value']] and bold_cells == [(0, 0)]:
+            print(f"✅ Bold label cell detected in: {html_input}")
+        else:
+            print(f"❌ Expected only cell (0, 0) bold in {html_input}, got {bold_cells}")
+            passed = False
+    
+    # Inline bold inside a cell with other text keeps the normal style
+    table = parse_html_table("<table><tr><td><b>Label</b></td><td>Status: <b>OK</b></td></tr></table>")
+    bold_cells = [cmd[1] for cmd in table.cell_styles if cmd[0] == 'FONTNAME']
+    if bold_cells == [(0, 0)]:
+        print("✅ Partially bold cell keeps the normal style")
+    else:
+        print(f"❌ Expected only cell (0, 0) bold for partially bold value, got {bold_cells}")
+        passed = False
+    
+    # XHTML output may start with an XML declaration that names an encoding
+    table = parse_html_table('<?xml version="1.0" encoding="utf-8"?>\n<table><tr><td>Label</td></tr></table>')
+    if table.pdf_rows == [['Label']]:
+        print("✅ Leading XML declaration ignored")
+    else:
+        print(f"❌ Expected one 'Label' cell after XML declaration, got {table.pdf_rows}")
+        passed = False
+    
+    # Empty cells must not add a line of leading: an all-empty row is just
+    # the cell padding high, as with the original all-Paragraph layout
+    from index import COL_WIDTHS, CELL_PADDING, TABLE_STYLE
+    from reportlab.platypus import LongTable
+    table = parse_html_table("<table><tr><td></td><td></td></tr><tr><td>Label</td><td>Value</td></tr></table>")
+    layout = LongTable(table.pdf_rows, colWidths=COL_WIDTHS)
+    layout.setStyle(TABLE_STYLE)
+    layout.wrap(sum(COL_WIDTHS), 1000)
+    if layout._rowHeights[0] == 2 * CELL_PADDING:
+        print("✅ Empty row has no extra line height")
+    else:
+        print(f"❌ Expected empty row height {2 * CELL_PADDING}, got {layout._rowHeights[0]}")
+        passed = False
+    
+    # The import-time warm-up should exercise the bold cell paths too
+    from index import PREWARM_TABLE, HEADER_STYLE
+    table = parse_html_table(PREWARM_TABLE)
+    bold_cells = [cmd[1] for cmd in table.cell_styles if cmd[0] == 'FONTNAME']
+    bold_paragraphs = [para for para in table.paragraphs if para.style is HEADER_STYLE]
+    if bold_cells == [(0, 0)] and len(bold_paragraphs) == 1:
+        print("✅ Warm-up table covers bold plain and Paragraph cells")
+    else:
+        print(f"❌ Warm-up table bold cells {bold_cells}, bold paragraphs {len(bold_paragraphs)}")
+        passed = False
+    print()
+    return passed
+
 def test_health_check(base_url):
     """Test the health check endpoint"""
     print("Testing health check endpoint...")
@@ -46,6 +112,35 @@ def test_generate_pdf(base_url, html_input, output_filename="test_report.pdf"):
         print(f"❌ Error: {e}\n")
         return False
 
+def test_cached_resend(base_url, html_input):
+    """Test that resending an identical body is served from the PDF cache"""
+    print("Testing identical request resend...")
+    try:
+        responses = []
+        for attempt in range(2):
+            start = time.perf_counter()
+            response = requests.post(
+                f"{base_url}/api/generate-pdf",
+                headers={"Content-Type": "application/json"},
+                json={"htmlTable": html_input}
+            )
+            elapsed = time.perf_counter() - start
+            print(f"Attempt {attempt + 1}: status {response.status_code} in {elapsed * 1000:.1f} ms")
+            responses.append(response)
+        
+        # A fresh render embeds a new timestamp and document ID, so identical
+        # bytes mean the second response came from the cache
+        if all(r.status_code == 200 for r in responses) and responses[0].content == responses[1].content:
+            print("✅ Identical request returned the cached PDF\n")
+            return True
+        else:
+            print("❌ Expected two identical 200 PDF responses\n")
+            return False
+    
+    except Exception as e:
+        print(f"❌ Error: {e}\n")
+        return False
+
 def test_error_cases(base_url):
     """Test error handling"""
     print("Testing error handling...")
@@ -80,6 +175,51 @@ def test_error_cases(base_url):
     except Exception as e:
         print(f"❌ Error: {e}")
     
+    # Test malformed JSON body
+    print("\n3. Testing malformed JSON body...")
+    try:
+        response = requests.post(
+            f"{base_url}/api/generate-pdf",
+            headers={"Content-Type": "application/json"},
+            data='{"htmlTable": "<table>'
+        )
+        if response.status_code == 400:
+            print(f"✅ Correctly returned 400: {response.json()}")
+        else:
+            print(f"❌ Expected 400, got {response.status_code}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
+    # Test non-string htmlTable
+    print("\n4. Testing non-string htmlTable...")
+    try:
+        response = requests.post(
+            f"{base_url}/api/generate-pdf",
+            headers={"Content-Type": "application/json"},
+            json={"htmlTable": 42}
+        )
+        if response.status_code == 400:
+            print(f"✅ Correctly returned 400: {response.json()}")
+        else:
+            print(f"❌ Expected 400, got {response.status_code}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
+    # Test body that is not a JSON object
+    print("\n5. Testing non-object request body...")
+    try:
+        response = requests.post(
+            f"{base_url}/api/generate-pdf",
+            headers={"Content-Type": "application/json"},
+            json=["<table><tr><td>Value</td></tr></table>"]
+        )
+        if response.status_code == 400:
+            print(f"✅ Correctly returned 400: {response.json()}")
+        else:
+            print(f"❌ Expected 400, got {response.status_code}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
     print()
 
 if __name__ == "__main__":
@@ -90,8 +230,10 @@ if __name__ == "__main__":
     print("=" * 60)
     
     # Run tests
+    test_parser()
     test_health_check(BASE_URL)
     test_generate_pdf(BASE_URL, html_table)
+    test_cached_resend(BASE_URL, html_table)
     test_error_cases(BASE_URL)
     
     print("=" * 60)